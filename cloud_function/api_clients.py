@@ -0,0 +1,85 @@
+"""Shared construction of googleapiclient resources for the YouTube APIs."""
+
+import functools
+import threading
+from typing import Any, Callable
+
+import google_auth_httplib2
+import httplib2
+from google.auth.credentials import Credentials
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+
+# Socket timeout for YouTube API requests
+HTTP_TIMEOUT_SECONDS = 30
+
+
+@functools.lru_cache(maxsize=None)
+def discovery_doc(service: str, version: str) -> str:
+    """Return the discovery document bundled with google-api-python-client.
+
+    Read once per process, so building a resource makes no network call or
+    file read. Kept as a string: build_from_document mutates a parsed dict,
+    which is not safe to share across threads.
+
+    Args:
+        service: API name, e.g. "youtube".
+        version: API version, e.g. "v3".
+
+    Returns:
+        The discovery document as JSON text.
+    """
+    return discovery_cache.get_static_doc(service, version)
+
+
+def build_resource(
+    service: str,
+    version: str,
+    credentials: Credentials | None = None,
+    developer_key: str | None = None,
+) -> Any:
+    """Build an API resource on its own persistent connection.
+
+    The httplib2.Http keeps its TLS connection alive, so the handshake is paid
+    once per resource rather than once per request.
+
+    Args:
+        service: API name, e.g. "youtubeAnalytics".
+        version: API version, e.g. "v2".
+        credentials: OAuth credentials to authorize requests with, if any.
+        developer_key: API key for APIs that accept one, if any.
+
+    Returns:
+        A googleapiclient Resource.
+    """
+    http = httplib2.Http(timeout=HTTP_TIMEOUT_SECONDS)
+    if credentials is not None:
+        http = google_auth_httplib2.AuthorizedHttp(credentials, http=http)
+    return build_from_document(
+        discovery_doc(service, version), developerKey=developer_key, http=http
+    )
+
+
+class PerThreadResource:
+    """Lazily builds one API resource per calling thread.
+
+    googleapiclient resources share one httplib2.Http, which is not
+    thread-safe, so worker threads must not share a resource.
+    """
+
+    def __init__(self, factory: Callable[[], Any]) -> None:
+        """Initialize with the callable that builds a resource.
+
+        Args:
+            factory: Zero-argument callable returning a new resource.
+        """
+        self._factory = factory
+        self._local = threading.local()
+
+    def get(self) -> Any:
+        """Return the calling thread's resource, building it on first use."""
+        resource = getattr(self._local, "resource", None)
+        if resource is None:
+            resource = self._factory()
+            self._local.resource = resource
+        return resource
@@ -1,161 +1,552 @@
 """BigQuery writer for YouTube analytics pipeline.
 
-Handles idempotent writes to all 4 tables using DELETE + batch load pattern.
+Handles idempotent writes to all 4 tables by replacing the snapshot_date
+partition:
+
+- Data API tables: a single WRITE_TRUNCATE batch load of Snappy-compressed Parquet.
+- Analytics API tables (small): rows are appended to a Storage Write API
+  pending stream and the stream is finalized; the partition is then cleared
+  and the stream committed. Readers can briefly see the day empty between
+  the delete and the commit.
 """
 
+import functools
 import io
-import json
 import logging
+import threading
+import uuid
 from datetime import date
 from typing import Any
 
-from google.cloud import bigquery
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from google.cloud import bigquery, bigquery_storage_v1, storage
+from google.cloud.bigquery_storage_v1 import types as storage_types
+from google.cloud.bigquery_storage_v1 import writer as storage_writer
+from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
 
 logger = logging.getLogger(__name__)
 
+# Clients cached at module scope so warm Cloud Function invocations reuse
+# the HTTP connection pool / gRPC channel and auth token
+_BQ_CLIENTS: dict[str, bigquery.Client] = {}
+_GCS_CLIENTS: dict[str, storage.Client] = {}
+_WRITE_CLIENT: bigquery_storage_v1.BigQueryWriteClient | None = None
+_WRITE_CLIENT_LOCK = threading.Lock()
+
+# Resumable upload chunk size when staging Parquet files in GCS
+GCS_UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024
+
+# Partition-replace load settings are identical for every table and day; built
+# once and shared (the client copies the config onto each job it starts)
+PARTITION_LOAD_CONFIG = bigquery.LoadJobConfig(
+    source_format=bigquery.SourceFormat.PARQUET,
+    write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+)
+
+# Rows per AppendRows request (keeps each request well under the 10 MB limit)
+STORAGE_WRITE_BATCH_ROWS = 500
+
+# Arrow schemas mirroring sql/create_tables.sql, so nullable INT64 columns
+# stay integers, TIMESTAMP/DATE columns load with the right types, and the
+# NOT NULL columns are written as required (BigQuery rejects a load that
+# would relax a REQUIRED column to NULLABLE)
+ARROW_SCHEMAS: dict[str, pa.Schema] = {
+    "video_metadata": pa.schema([
+        pa.field("video_id", pa.string(), nullable=False),
+        ("title", pa.string()),
+        ("published_at", pa.timestamp("us", tz="UTC")),
+        ("duration_seconds", pa.int64()),
+        ("duration_formatted", pa.string()),
+        ("video_type", pa.string()),
+        ("tags", pa.string()),
+        ("category_id", pa.string()),
+        ("thumbnail_url", pa.string()),
+        pa.field("snapshot_date", pa.date32(), nullable=False),
+    ]),
+    "daily_video_stats": pa.schema([
+        pa.field("snapshot_date", pa.date32(), nullable=False),
+        pa.field("video_id", pa.string(), nullable=False),
+        ("view_count", pa.int64()),
+        ("like_count", pa.int64()),
+        ("comment_count", pa.int64()),
+        ("favorite_count", pa.int64()),
+    ]),
+    "daily_video_analytics": pa.schema([
+        pa.field("snapshot_date", pa.date32(), nullable=False),
+        pa.field("video_id", pa.string(), nullable=False),
+        ("estimated_minutes_watched", pa.float64()),
+        ("average_view_duration_seconds", pa.float64()),
+        ("average_view_percentage", pa.float64()),
+        ("impressions", pa.int64()),
+        ("impression_ctr", pa.float64()),
+        ("subscribers_gained", pa.int64()),
+        ("subscribers_lost", pa.int64()),
+        ("shares", pa.int64()),
+        ("annotation_click_through_rate", pa.float64()),
+        ("card_click_rate", pa.float64()),
+    ]),
+    "daily_traffic_sources": pa.schema([
+        pa.field("snapshot_date", pa.date32(), nullable=False),
+        pa.field("video_id", pa.string(), nullable=False),
+        ("traffic_source_type", pa.string()),
+        ("views", pa.int64()),
+        ("estimated_minutes_watched", pa.float64()),
+    ]),
+}
+
+
+# Storage Write API row encoding: proto2 scalar type per Arrow column type.
+# DATE is sent as int32 days since the Unix epoch.
+_PROTO_TYPES: dict[pa.DataType, int] = {
+    pa.string(): descriptor_pb2.FieldDescriptorProto.TYPE_STRING,
+    pa.int64(): descriptor_pb2.FieldDescriptorProto.TYPE_INT64,
+    pa.float64(): descriptor_pb2.FieldDescriptorProto.TYPE_DOUBLE,
+    pa.date32(): descriptor_pb2.FieldDescriptorProto.TYPE_INT32,
+}
+
+
+def _get_write_client() -> bigquery_storage_v1.BigQueryWriteClient:
+    """Return the shared Storage Write API client, creating it on first use."""
+    global _WRITE_CLIENT
+    # Tables are written from worker threads — create the client once
+    with _WRITE_CLIENT_LOCK:
+        if _WRITE_CLIENT is None:
+            _WRITE_CLIENT = bigquery_storage_v1.BigQueryWriteClient()
+    return _WRITE_CLIENT
+
+
+@functools.lru_cache(maxsize=None)
+def _proto_message(table_name: str) -> tuple[type, descriptor_pb2.DescriptorProto]:
+    """Build a protobuf message class for a table's rows from its Arrow schema.
+
+    Args:
+        table_name: BigQuery table name, used to look up the Arrow schema.
+
+    Returns:
+        Tuple of (message_class, descriptor) for the Storage Write API.
+    """
+    descriptor = descriptor_pb2.DescriptorProto(name=table_name)
+    for number, field in enumerate(ARROW_SCHEMAS[table_name], start=1):
+        descriptor.field.add(
+            name=field.name,
+            number=number,
+            type=_PROTO_TYPES[field.type],
+            label=(
+                descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL
+                if field.nullable
+                else descriptor_pb2.FieldDescriptorProto.LABEL_REQUIRED
+            ),
+        )
+
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(
+        descriptor_pb2.FileDescriptorProto(
+            name=f"{table_name}.proto", package="youtube_analytics", message_type=[descriptor]
+        )
+    )
+    message_class = message_factory.GetMessageClass(
+        pool.FindMessageTypeByName(f"youtube_analytics.{table_name}")
+    )
+    return message_class, descriptor
+
+
+def _serialize_rows(table_name: str, table: pa.Table) -> list[bytes]:
+    """Encode an Arrow table as serialized protobuf rows for the Storage Write API.
+
+    Args:
+        table_name: BigQuery table name, used to look up the message class.
+        table: Arrow table matching the table's Arrow schema.
+
+    Returns:
+        One serialized message per row (NULL columns are left unset).
+    """
+    message_class, _ = _proto_message(table_name)
+    # date32 is stored as days since epoch, which is exactly the wire value
+    wire_schema = pa.schema(
+        [f.with_type(pa.int32()) if f.type == pa.date32() else f for f in table.schema]
+    )
+    return [
+        message_class(**{k: v for k, v in row.items() if v is not None}).SerializeToString()
+        for row in table.cast(wire_schema).to_pylist()
+    ]
+
+
+def _constant_date_column(value: date, length: int) -> pa.Array:
+    """Broadcast a single DATE value into an Arrow column of the given length."""
+    return pa.repeat(pa.scalar(value, pa.date32()), length)
+
+
+def build_data_api_tables(
+    videos: list[dict[str, Any]], snapshot_date: date
+) -> tuple[pa.Table, pa.Table, int, int]:
+    """Build the video_metadata and daily_video_stats tables in one pass.
+
+    Each column of both tables is collected into a list in a single walk over
+    the video details (no per-row dicts), and the shorts count is taken from
+    the resulting video_type column.
+
+    Args:
+        videos: List of video detail dicts from YouTubeDataAPI.
+        snapshot_date: The partition date.
+
+    Returns:
+        Tuple of (metadata_table, stats_table, shorts_count, full_length_count).
+    """
+    metadata_schema = ARROW_SCHEMAS["video_metadata"]
+    stats_schema = ARROW_SCHEMAS["daily_video_stats"]
+    names = [
+        name
+        for name in dict.fromkeys(metadata_schema.names + stats_schema.names)
+        if name != "snapshot_date"
+    ]
+    columns: dict[str, Any] = {name: [] for name in names}
+    appends = [(name, columns[name].append) for name in names]
+    for v in videos:
+        for name, append in appends:
+            append(v[name])
+    columns["snapshot_date"] = _constant_date_column(snapshot_date, len(videos))
+
+    # Data API timestamps are RFC 3339 strings ('' when missing)
+    published = pa.array(columns["published_at"], pa.string())
+    columns["published_at"] = pc.if_else(
+        pc.equal(published, ""), None, published
+    ).cast(metadata_schema.field("published_at").type)
+
+    metadata_table = pa.table(
+        {name: columns[name] for name in metadata_schema.names}, schema=metadata_schema
+    )
+    stats_table = pa.table(
+        {name: columns[name] for name in stats_schema.names}, schema=stats_schema
+    )
+    shorts_count = pc.sum(pc.equal(metadata_table["video_type"], "short")).as_py() or 0
+    return metadata_table, stats_table, shorts_count, len(videos) - shorts_count
+
 
 class BigQueryWriter:
     """Writes YouTube data to BigQuery tables with idempotent upserts."""
 
-    def __init__(self, project_id: str, dataset_id: str) -> None:
-        """Initialize BigQuery client.
+    def __init__(
+        self, project_id: str, dataset_id: str, staging_bucket: str | None = None
+    ) -> None:
+        """Initialize BigQuery client (reused across warm invocations).
 
         Args:
             project_id: GCP project ID.
             dataset_id: BigQuery dataset name.
+            staging_bucket: Optional GCS bucket for staging load files. When set,
+                Parquet is uploaded to GCS and loaded from there instead of
+                being posted directly to BigQuery.
         """
-        self.client = bigquery.Client(project=project_id)
+        if project_id not in _BQ_CLIENTS:
+            _BQ_CLIENTS[project_id] = bigquery.Client(project=project_id)
+        self.client = _BQ_CLIENTS[project_id]
+        self.staging_bucket = None
+        if staging_bucket:
+            if project_id not in _GCS_CLIENTS:
+                _GCS_CLIENTS[project_id] = storage.Client(project=project_id)
+            self.staging_bucket = _GCS_CLIENTS[project_id].bucket(staging_bucket)
+        self.project_id = project_id
+        self.dataset_id = dataset_id
         self.dataset_ref = f"{project_id}.{dataset_id}"
 
     def write_video_metadata(
-        self, videos: list[dict[str, Any]], snapshot_date: date
+        self,
+        videos: list[dict[str, Any]] | pa.Table,
+        snapshot_date: date,
+        *,
+        force_delete: bool = False,
     ) -> int:
         """Write video metadata rows, replacing existing data for this snapshot_date.
 
         Args:
-            videos: List of video detail dicts from YouTubeDataAPI.
+            videos: List of video detail dicts from YouTubeDataAPI, or the
+                metadata table from build_data_api_tables.
             snapshot_date: The partition date.
+            force_delete: Clear the partition even when there are no rows.
 
         Returns:
             Number of rows written.
         """
-        rows = [
-            {
-                "video_id": v["video_id"],
-                "title": v["title"],
-                "published_at": v["published_at"],
-                "duration_seconds": v["duration_seconds"],
-                "duration_formatted": v["duration_formatted"],
-                "video_type": v["video_type"],
-                "tags": v["tags"],
-                "category_id": v["category_id"],
-                "thumbnail_url": v["thumbnail_url"],
-            }
-            for v in videos
-        ]
-        return self._delete_and_insert("video_metadata", rows, snapshot_date)
+        if isinstance(videos, pa.Table):
+            table = videos
+        else:
+            table = build_data_api_tables(videos, snapshot_date)[0]
+        return self._replace_partition("video_metadata", table, snapshot_date, force_delete)
 
     def write_daily_video_stats(
-        self, videos: list[dict[str, Any]], snapshot_date: date
+        self,
+        videos: list[dict[str, Any]] | pa.Table,
+        snapshot_date: date,
+        *,
+        force_delete: bool = False,
     ) -> int:
         """Write daily video stats, replacing existing data for this snapshot_date.
 
         Args:
-            videos: List of video detail dicts from YouTubeDataAPI.
+            videos: List of video detail dicts from YouTubeDataAPI, or the
+                stats table from build_data_api_tables.
             snapshot_date: The partition date.
+            force_delete: Clear the partition even when there are no rows.
 
         Returns:
             Number of rows written.
         """
-        rows = [
-            {
-                "video_id": v["video_id"],
-                "view_count": v["view_count"],
-                "like_count": v["like_count"],
-                "comment_count": v["comment_count"],
-                "favorite_count": v["favorite_count"],
-            }
-            for v in videos
-        ]
-        return self._delete_and_insert("daily_video_stats", rows, snapshot_date)
+        if isinstance(videos, pa.Table):
+            table = videos
+        else:
+            table = build_data_api_tables(videos, snapshot_date)[1]
+        return self._replace_partition("daily_video_stats", table, snapshot_date, force_delete)
 
     def write_daily_video_analytics(
-        self, analytics: list[dict[str, Any]], snapshot_date: date
+        self,
+        analytics: list[dict[str, Any]] | pa.Table,
+        snapshot_date: date,
+        *,
+        force_delete: bool = False,
     ) -> int:
         """Write daily video analytics from the Analytics API.
 
         Args:
-            analytics: List of analytics dicts per video.
+            analytics: Analytics rows per video — an Arrow table from
+                YouTubeAnalyticsAPI.get_video_analytics, or a list of dicts.
             snapshot_date: The partition date.
+            force_delete: Clear the partition even when there are no rows.
 
         Returns:
             Number of rows written.
         """
-        return self._delete_and_insert("daily_video_analytics", analytics, snapshot_date)
+        table = self._table_from_rows("daily_video_analytics", analytics, snapshot_date)
+        return self._stream_partition("daily_video_analytics", table, snapshot_date, force_delete)
 
     def write_daily_traffic_sources(
-        self, traffic: list[dict[str, Any]], snapshot_date: date
+        self,
+        traffic: list[dict[str, Any]],
+        snapshot_date: date,
+        *,
+        force_delete: bool = False,
     ) -> int:
         """Write daily traffic source data.
 
         Args:
             traffic: List of traffic source dicts.
             snapshot_date: The partition date.
+            force_delete: Clear the partition even when there are no rows.
 
         Returns:
             Number of rows written.
         """
-        return self._delete_and_insert("daily_traffic_sources", traffic, snapshot_date)
+        table = self._table_from_rows("daily_traffic_sources", traffic, snapshot_date)
+        return self._stream_partition("daily_traffic_sources", table, snapshot_date, force_delete)
+
+    @staticmethod
+    def _table_from_rows(
+        table_name: str, rows: list[dict[str, Any]] | pa.Table, snapshot_date: date
+    ) -> pa.Table:
+        """Convert pre-built rows from the Analytics API into an Arrow table.
+
+        Args:
+            table_name: BigQuery table name, used to look up the Arrow schema.
+            rows: List of row dicts, or an Arrow table without snapshot_date.
+            snapshot_date: The partition date.
+
+        Returns:
+            Arrow table matching the BigQuery table schema.
+        """
+        # snapshot_date is broadcast as a constant column rather than set on
+        # every row dict, which also leaves the caller's rows unmodified
+        schema = ARROW_SCHEMAS[table_name]
+        index = schema.get_field_index("snapshot_date")
+        row_schema = schema.remove(index)
+        if isinstance(rows, pa.Table):
+            table = rows.select(row_schema.names).cast(row_schema)
+        else:
+            table = pa.Table.from_pylist(rows, schema=row_schema)
+        return table.add_column(
+            index, schema.field(index), _constant_date_column(snapshot_date, table.num_rows)
+        )
+
+    def _partition_ref(self, table_name: str, snapshot_date: date) -> str:
+        """Return the partition decorator reference (table$YYYYMMDD) for a date."""
+        return f"{self.dataset_ref}.{table_name}${snapshot_date.strftime('%Y%m%d')}"
 
-    def _delete_and_insert(
-        self, table_name: str, rows: list[dict[str, Any]], snapshot_date: date
+    def _skip_empty(self, table_name: str, snapshot_date: date, force_delete: bool) -> int:
+        """Handle a write with no rows, avoiding a BigQuery round-trip unless forced.
+
+        Empty Analytics API results are common (data not yet available for the
+        lookback date), so by default the partition is left untouched.
+
+        Args:
+            table_name: BigQuery table name (without project/dataset prefix).
+            snapshot_date: Partition date.
+            force_delete: Clear the partition anyway so a re-run leaves no stale rows.
+
+        Returns:
+            Always 0 (rows inserted).
+        """
+        if force_delete:
+            # Metadata-only partition delete, not a DML job
+            self.client.delete_table(self._partition_ref(table_name, snapshot_date), not_found_ok=True)
+            logger.info(f"No rows to insert into {table_name} — cleared {snapshot_date} partition")
+        else:
+            logger.info(f"No rows to insert into {table_name} — {snapshot_date} partition left as is")
+        return 0
+
+    def _replace_partition(
+        self,
+        table_name: str,
+        table: pa.Table,
+        snapshot_date: date,
+        force_delete: bool = False,
     ) -> int:
-        """Idempotent write: delete existing rows for snapshot_date, then batch insert.
+        """Idempotent write: atomically replace the snapshot_date partition.
 
-        Uses batch loading (not streaming insert) to avoid eventual consistency
-        issues with BigQuery's streaming buffer.
+        Loads with WRITE_TRUNCATE into the partition decorator (table$YYYYMMDD),
+        which swaps out only that day's partition in a single job — no DML
+        DELETE. Uses batch loading (not streaming insert) to avoid eventual
+        consistency issues with BigQuery's streaming buffer.
 
         Args:
             table_name: BigQuery table name (without project/dataset prefix).
-            rows: List of row dicts to insert.
-            snapshot_date: Date to delete before inserting.
+            table: Arrow table of rows to insert (columnar, matching ARROW_SCHEMAS).
+            snapshot_date: Partition date to replace.
+            force_delete: Clear the partition even when there are no rows.
 
         Returns:
             Number of rows inserted.
         """
-        table_ref = f"{self.dataset_ref}.{table_name}"
+        if table.num_rows == 0:
+            return self._skip_empty(table_name, snapshot_date, force_delete)
 
-        # Step 1: Delete existing rows for this snapshot_date
-        delete_query = f"DELETE FROM `{table_ref}` WHERE snapshot_date = @snapshot_date"
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("snapshot_date", "DATE", str(snapshot_date))
-            ]
+        partition_ref = self._partition_ref(table_name, snapshot_date)
+
+        if self.staging_bucket is not None:
+            self._load_via_gcs(table_name, table, partition_ref, snapshot_date)
+        else:
+            buf = io.BytesIO()
+            pq.write_table(table, buf, compression="snappy")
+            buf.seek(0)
+            load_job = self.client.load_table_from_file(
+                buf,
+                partition_ref,
+                job_config=PARTITION_LOAD_CONFIG,
+            )
+            load_job.result()  # Wait for completion
+
+        logger.info(f"Replaced {table_name} partition {snapshot_date} with {table.num_rows} rows")
+        return table.num_rows
+
+    def _load_via_gcs(
+        self,
+        table_name: str,
+        table: pa.Table,
+        partition_ref: str,
+        snapshot_date: date,
+    ) -> None:
+        """Stage the table as Parquet in GCS, then load it from there.
+
+        Parquet is streamed into a resumable upload as it is written, and the
+        staged object is removed once the load job succeeds.
+
+        Args:
+            table_name: BigQuery table name (without project/dataset prefix).
+            table: Arrow table of rows to insert.
+            partition_ref: Destination partition (table$YYYYMMDD).
+            snapshot_date: Partition date, used in the object path.
+        """
+        blob = self.staging_bucket.blob(
+            f"ingest/{snapshot_date}/{table_name}/{uuid.uuid4()}.parquet"
+        )
+        with blob.open("wb", chunk_size=GCS_UPLOAD_CHUNK_BYTES) as f:
+            pq.write_table(table, f, compression="snappy")
+
+        uri = f"gs://{self.staging_bucket.name}/{blob.name}"
+        load_job = self.client.load_table_from_uri(uri, partition_ref, job_config=PARTITION_LOAD_CONFIG)
+        load_job.result()  # Wait for completion
+        blob.delete()
+
+    def _stream_partition(
+        self,
+        table_name: str,
+        table: pa.Table,
+        snapshot_date: date,
+        force_delete: bool = False,
+    ) -> int:
+        """Idempotent write via a Storage Write API pending stream.
+
+        Used for the small Analytics API tables, where a load job's fixed
+        overhead dominates. All rows are appended to a PENDING stream, which
+        stays invisible until committed; the snapshot_date partition is only
+        cleared once the stream is finalized, right before the commit. A
+        failure while serializing or appending leaves the existing day in
+        place, and readers see the day empty only between the delete and the
+        commit. Does not count against the per-table load job quota.
+
+        Args:
+            table_name: BigQuery table name (without project/dataset prefix).
+            table: Arrow table of rows to insert (columnar, matching ARROW_SCHEMAS).
+            snapshot_date: Partition date to replace.
+            force_delete: Clear the partition even when there are no rows.
+
+        Returns:
+            Number of rows inserted.
+
+        Raises:
+            RuntimeError: If BigQuery reports errors committing the stream.
+        """
+        if table.num_rows == 0:
+            return self._skip_empty(table_name, snapshot_date, force_delete)
+
+        write_client = _get_write_client()
+        parent = write_client.table_path(self.project_id, self.dataset_id, table_name)
+        write_stream = write_client.create_write_stream(
+            parent=parent,
+            write_stream=storage_types.WriteStream(type_=storage_types.WriteStream.Type.PENDING),
         )
-        self.client.query(delete_query, job_config=job_config).result()
-        logger.info(f"Deleted existing rows from {table_name} for {snapshot_date}")
-
-        # Step 2: Batch insert new rows
-        if not rows:
-            logger.info(f"No rows to insert into {table_name}")
-            return 0
-
-        # Add snapshot_date to each row
-        for row in rows:
-            row["snapshot_date"] = str(snapshot_date)
-
-        # Use batch load (not streaming) for consistency with the DELETE above
-        json_data = "\n".join(json.dumps(row) for row in rows)
-        load_job_config = bigquery.LoadJobConfig(
-            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
-            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+
+        _, descriptor = _proto_message(table_name)
+        request_template = storage_types.AppendRowsRequest(
+            write_stream=write_stream.name,
+            proto_rows=storage_types.AppendRowsRequest.ProtoData(
+                writer_schema=storage_types.ProtoSchema(proto_descriptor=descriptor)
+            ),
         )
-        load_job = self.client.load_table_from_file(
-            io.BytesIO(json_data.encode()),
-            table_ref,
-            job_config=load_job_config,
+        append_rows_stream = storage_writer.AppendRowsStream(write_client, request_template)
+
+        serialized_rows = _serialize_rows(table_name, table)
+        try:
+            futures = [
+                append_rows_stream.send(
+                    storage_types.AppendRowsRequest(
+                        offset=offset,
+                        proto_rows=storage_types.AppendRowsRequest.ProtoData(
+                            rows=storage_types.ProtoRows(
+                                serialized_rows=serialized_rows[offset : offset + STORAGE_WRITE_BATCH_ROWS]
+                            )
+                        ),
+                    )
+                )
+                for offset in range(0, len(serialized_rows), STORAGE_WRITE_BATCH_ROWS)
+            ]
+            for future in futures:
+                future.result()  # Wait for each append to be acknowledged
+        finally:
+            append_rows_stream.close()
+
+        write_client.finalize_write_stream(name=write_stream.name)
+
+        # Clear the old rows only once the new ones are staged and finalized
+        self.client.delete_table(self._partition_ref(table_name, snapshot_date), not_found_ok=True)
+        commit_response = write_client.batch_commit_write_streams(
+            storage_types.BatchCommitWriteStreamsRequest(
+                parent=parent, write_streams=[write_stream.name]
+            )
         )
-        load_job.result()  # Wait for completion
+        if commit_response.stream_errors:
+            raise RuntimeError(
+                f"Storage Write commit failed for {table_name}: {commit_response.stream_errors}"
+            )
 
-        logger.info(f"Inserted {len(rows)} rows into {table_name}")
-        return len(rows)
+        logger.info(f"Replaced {table_name} partition {snapshot_date} with {table.num_rows} rows")
+        return table.num_rows
@@ -4,14 +4,19 @@ Orchestrates daily snapshot of YouTube analytics data into BigQuery.
 Triggered by Cloud Scheduler via HTTP.
 """
 
+import json
 import logging
 import os
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, timedelta
+from typing import Any
 
 import functions_framework
+import pyarrow as pa
+from google.cloud import storage
 
-from bigquery_writer import BigQueryWriter
+from bigquery_writer import BigQueryWriter, build_data_api_tables
 from youtube_data_api import YouTubeDataAPI
 
 # ─── Structured Logging Setup ────────────────────────────────────
@@ -34,8 +39,15 @@ DATASET_ID = os.environ.get("BQ_DATASET", "youtube_analytics")
 CHANNEL_ID = os.environ.get("YOUTUBE_CHANNEL_ID", "UCkRi29nXFxNBuPhjseoB6AQ")
 UPLOADS_PLAYLIST_ID = os.environ.get("UPLOADS_PLAYLIST_ID", "UUkRi29nXFxNBuPhjseoB6AQ")
 YOUTUBE_API_KEY = os.environ.get("YOUTUBE_API_KEY")
+GCS_STAGING_BUCKET = os.environ.get("GCS_STAGING_BUCKET")  # Optional: stage loads + ETag cache in GCS
 ANALYTICS_LOOKBACK_DAYS = int(os.environ.get("ANALYTICS_LOOKBACK_DAYS", "3"))
 
+# Object in GCS_STAGING_BUCKET holding playlistItems page ETags between runs
+ETAG_CACHE_BLOB = f"cache/playlist_etags/{UPLOADS_PLAYLIST_ID}.json"
+
+# Created on first use; reused across warm invocations
+_GCS_CLIENT: storage.Client | None = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -89,48 +101,79 @@ def run_pipeline(snapshot_date: date, log: logging.LoggerAdapter) -> dict:
         api_key=YOUTUBE_API_KEY,
         uploads_playlist_id=UPLOADS_PLAYLIST_ID,
     )
-    bq_writer = BigQueryWriter(project_id=PROJECT_ID, dataset_id=DATASET_ID)
-
-    # Step 1: Fetch all video IDs
-    video_ids = data_api.get_all_video_ids()
-    log.info(f"Fetched {len(video_ids)} video IDs from uploads playlist")
+    bq_writer = BigQueryWriter(
+        project_id=PROJECT_ID, dataset_id=DATASET_ID, staging_bucket=GCS_STAGING_BUCKET
+    )
 
-    # Step 2: Fetch video details (metadata + public stats)
-    video_details = data_api.get_video_details(video_ids)
-    log.info(f"Fetched details for {len(video_details)} videos")
+    # Steps 1-2: Fetch all video IDs and their details (metadata + public
+    # stats); videos.list batches overlap with paging through the playlist
+    # Playlist page ETags persist in the staging bucket (when set), so the
+    # next day's cold start can revalidate pages instead of re-reading them
+    etag_cache = _load_etag_cache(log)
+    video_ids, video_details = data_api.get_all_videos(etag_cache=etag_cache)
+    _save_etag_cache(etag_cache, log)
+    log.info(f"Fetched {len(video_ids)} video IDs, details for {len(video_details)} videos")
+
+    # Build both Data API tables (and the shorts count) in one pass
+    metadata_table, stats_table, shorts_count, full_length_count = build_data_api_tables(
+        video_details, snapshot_date
+    )
 
-    # Step 3: Write to BigQuery — Data API tables
-    metadata_count = bq_writer.write_video_metadata(video_details, snapshot_date)
-    log.info(f"Wrote video_metadata — {metadata_count} rows")
-    stats_count = bq_writer.write_daily_video_stats(video_details, snapshot_date)
-    log.info(f"Wrote daily_video_stats — {stats_count} rows")
+    # BigQuery jobs are server-side waits and bigquery.Client is thread-safe,
+    # so the four table writes run concurrently (one worker per table)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        # Step 3: Write to BigQuery — Data API tables
+        metadata_future = executor.submit(
+            bq_writer.write_video_metadata, metadata_table, snapshot_date
+        )
+        stats_future = executor.submit(
+            bq_writer.write_daily_video_stats, stats_table, snapshot_date
+        )
 
-    # Step 4: Analytics API (requires OAuth2)
-    analytics_count = 0
-    traffic_count = 0
-    analytics_errors: list[str] = []
+        # Step 4: Analytics API (requires OAuth2) — fetched while the Data API writes run
+        analytics_errors: list[str] = []
+        analytics_futures: dict[str, Any] = {}
 
-    try:
-        analytics_date = snapshot_date - timedelta(days=ANALYTICS_LOOKBACK_DAYS)
-        analytics_count, traffic_count, analytics_errors = _run_analytics(
-            video_ids, analytics_date, snapshot_date, bq_writer
-        )
-        log.info(f"Wrote daily_video_analytics — {analytics_count} rows")
-        log.info(f"Wrote daily_traffic_sources — {traffic_count} rows")
-        if analytics_errors:
-            log.warning(
-                f"Analytics API had {len(analytics_errors)} partial errors"
+        try:
+            analytics_date = snapshot_date - timedelta(days=ANALYTICS_LOOKBACK_DAYS)
+            video_analytics, traffic_data, analytics_errors = _fetch_analytics(
+                video_ids, analytics_date
             )
-    except ImportError:
-        log.info("Analytics API module not available — skipping")
-    except Exception as e:
-        log.warning(f"Analytics API failed entirely: {e}")
-        analytics_errors.append(f"Analytics API: {str(e)}")
+            if analytics_errors:
+                log.warning(
+                    f"Analytics API had {len(analytics_errors)} partial errors"
+                )
+            analytics_futures["daily_video_analytics"] = executor.submit(
+                bq_writer.write_daily_video_analytics, video_analytics, snapshot_date
+            )
+            analytics_futures["daily_traffic_sources"] = executor.submit(
+                bq_writer.write_daily_traffic_sources, traffic_data, snapshot_date
+            )
+        except ImportError:
+            log.info("Analytics API module not available — skipping")
+        except Exception as e:
+            log.warning(f"Analytics API failed entirely: {e}")
+            analytics_errors.append(f"Analytics API: {str(e)}")
+
+        # Await each analytics write on its own, so one failed write neither
+        # hides the other's row count nor gets reported as an API failure
+        analytics_counts = {"daily_video_analytics": 0, "daily_traffic_sources": 0}
+        for table_name, future in analytics_futures.items():
+            try:
+                analytics_counts[table_name] = future.result()
+                log.info(f"Wrote {table_name} — {analytics_counts[table_name]} rows")
+            except Exception as e:
+                log.warning(f"BigQuery write to {table_name} failed: {e}")
+                analytics_errors.append(f"BigQuery {table_name}: {str(e)}")
+        analytics_count = analytics_counts["daily_video_analytics"]
+        traffic_count = analytics_counts["daily_traffic_sources"]
+
+        metadata_count = metadata_future.result()
+        log.info(f"Wrote video_metadata — {metadata_count} rows")
+        stats_count = stats_future.result()
+        log.info(f"Wrote daily_video_stats — {stats_count} rows")
 
     # Build summary
-    shorts_count = sum(1 for v in video_details if v["video_type"] == "short")
-    full_length_count = len(video_details) - shorts_count
-
     return {
         "snapshot_date": str(snapshot_date),
         "videos_processed": len(video_details),
@@ -146,24 +189,20 @@ def run_pipeline(snapshot_date: date, log: logging.LoggerAdapter) -> dict:
     }
 
 
-def _run_analytics(
+def _fetch_analytics(
     video_ids: list[str],
     analytics_date: date,
-    snapshot_date: date,
-    bq_writer: BigQueryWriter,
-) -> tuple[int, int, list[str]]:
-    """Run the Analytics API portion of the pipeline.
+) -> tuple[pa.Table, list[dict], list[str]]:
+    """Fetch the Analytics API portion of the pipeline.
 
     Separated to allow graceful failure if OAuth2 is not configured yet.
 
     Args:
         video_ids: List of video IDs to fetch analytics for.
         analytics_date: The date to query from Analytics API.
-        snapshot_date: The BigQuery partition date.
-        bq_writer: BigQuery writer instance.
 
     Returns:
-        Tuple of (analytics_rows, traffic_rows, error_messages).
+        Tuple of (video_analytics_table, traffic_rows, error_messages).
     """
     from youtube_analytics_api import YouTubeAnalyticsAPI
 
@@ -173,13 +212,70 @@ def _run_analytics(
     video_analytics, analytics_errors = analytics_api.get_video_analytics(
         video_ids, analytics_date
     )
-    analytics_count = bq_writer.write_daily_video_analytics(video_analytics, snapshot_date)
 
     # Fetch traffic sources
     traffic_data, traffic_errors = analytics_api.get_traffic_sources(
         video_ids, analytics_date
     )
-    traffic_count = bq_writer.write_daily_traffic_sources(traffic_data, snapshot_date)
 
     all_errors = analytics_errors + traffic_errors
-    return analytics_count, traffic_count, all_errors
+    return video_analytics, traffic_data, all_errors
+
+
+def _etag_cache_blob() -> Any:
+    """Return the GCS blob holding the ETag cache, or None if no bucket is set.
+
+    The storage client is created on first use and reused across warm
+    invocations.
+    """
+    global _GCS_CLIENT
+    if not GCS_STAGING_BUCKET:
+        return None
+    if _GCS_CLIENT is None:
+        _GCS_CLIENT = storage.Client(project=PROJECT_ID)
+    return _GCS_CLIENT.bucket(GCS_STAGING_BUCKET).blob(ETAG_CACHE_BLOB)
+
+
+def _load_etag_cache(log: logging.LoggerAdapter) -> dict | None:
+    """Load the persisted playlistItems ETag cache from GCS_STAGING_BUCKET.
+
+    Args:
+        log: LoggerAdapter with run_id for correlated logging.
+
+    Returns:
+        The page cache dict (empty on first run), or None when no bucket is
+        configured. A cache that can't be read or isn't a JSON object is
+        treated as empty.
+    """
+    try:
+        blob = _etag_cache_blob()
+        if blob is None:
+            return None
+        if not blob.exists():
+            return {}
+        etag_cache = json.loads(blob.download_as_bytes())
+    except Exception as e:
+        log.warning(f"Could not load playlist ETag cache — fetching all pages: {e}")
+        return {}
+    if not isinstance(etag_cache, dict):
+        log.warning("Playlist ETag cache is not a JSON object — fetching all pages")
+        return {}
+    return etag_cache
+
+
+def _save_etag_cache(etag_cache: dict | None, log: logging.LoggerAdapter) -> None:
+    """Persist the playlistItems ETag cache to GCS_STAGING_BUCKET (best effort).
+
+    Args:
+        etag_cache: Page cache updated by YouTubeDataAPI.get_all_videos, or
+            None when no bucket is configured.
+        log: LoggerAdapter with run_id for correlated logging.
+    """
+    if etag_cache is None:
+        return
+    try:
+        _etag_cache_blob().upload_from_string(
+            json.dumps(etag_cache), content_type="application/json"
+        )
+    except Exception as e:
+        log.warning(f"Could not save playlist ETag cache: {e}")
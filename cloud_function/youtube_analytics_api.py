@@ -1,15 +1,22 @@
 """YouTube Analytics API v2 client for fetching watch time, engagement, and traffic data."""
 
 import logging
+import os
+import random
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
-from typing import Any
+from typing import Any, Callable
 
+import pyarrow as pa
+import pyarrow.compute as pc
 from google.cloud import secretmanager
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from api_clients import PerThreadResource, build_resource
+
 logger = logging.getLogger(__name__)
 
 # Secret Manager secret names
@@ -20,6 +27,48 @@ SECRET_REFRESH_TOKEN = "youtube-oauth-refresh-token"
 TOKEN_URI = "https://oauth2.googleapis.com/token"
 SCOPES = ["https://www.googleapis.com/auth/yt-analytics.readonly"]
 
+# Cached at module scope so warm Cloud Function invocations skip the
+# Secret Manager channel setup and the three secret reads
+_SM_CLIENT: secretmanager.SecretManagerServiceClient | None = None
+_SM_CLIENT_LOCK = threading.Lock()
+_CREDENTIALS: dict[str, Credentials] = {}
+
+# Response columns of the per-video analytics query (dimension + metrics, in
+# query order) and their daily_video_analytics column names / types
+VIDEO_ANALYTICS_COLUMNS: list[tuple[str, pa.DataType]] = [
+    ("video_id", pa.string()),
+    ("estimated_minutes_watched", pa.float64()),
+    ("average_view_duration_seconds", pa.float64()),
+    ("average_view_percentage", pa.float64()),
+    ("subscribers_gained", pa.int64()),
+    ("subscribers_lost", pa.int64()),
+    ("shares", pa.int64()),
+]
+
+# Page size for the per-video analytics query (API max for dimensions=video)
+ANALYTICS_PAGE_SIZE = 200
+
+# daily_video_analytics columns not returned by the query (written as NULL).
+# Impressions/CTR populated from traffic source data
+VIDEO_ANALYTICS_NULL_COLUMNS: list[tuple[str, pa.DataType]] = [
+    ("impressions", pa.int64()),
+    ("impression_ctr", pa.float64()),
+    ("annotation_click_through_rate", pa.float64()),
+    ("card_click_rate", pa.float64()),
+]
+
+# Retry policy: rate limits and transient server errors are retried with
+# exponential backoff and full jitter, unless the server sends Retry-After
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RETRY_BASE_SECONDS = 1.0
+RETRY_MAX_SECONDS = 30.0
+
+# Videos per batched traffic source query (video filter accepts a list)
+TRAFFIC_BATCH_SIZE = 200
+
+# Max in-flight per-video traffic source requests (fallback path)
+TRAFFIC_CONCURRENCY = int(os.environ.get("TRAFFIC_CONCURRENCY", "16"))
+
 
 class YouTubeAnalyticsAPI:
     """Client for YouTube Analytics API v2 using OAuth2 credentials from Secret Manager."""
@@ -30,11 +79,16 @@ class YouTubeAnalyticsAPI:
         Args:
             project_id: GCP project ID for Secret Manager access.
         """
-        credentials = self._load_credentials(project_id)
-        self.analytics = build("youtubeAnalytics", "v2", credentials=credentials)
+        self.credentials = self._load_credentials(project_id)
+        self.analytics = self._build_analytics()
+        self._thread_analytics = PerThreadResource(self._build_analytics)
+
+    def _build_analytics(self) -> Any:
+        """Build an Analytics API resource with its own persistent connection."""
+        return build_resource("youtubeAnalytics", "v2", credentials=self.credentials)
 
     def _load_credentials(self, project_id: str) -> Credentials:
-        """Load OAuth2 credentials from Secret Manager.
+        """Load OAuth2 credentials from Secret Manager, cached per project.
 
         Args:
             project_id: GCP project ID.
@@ -42,11 +96,18 @@ class YouTubeAnalyticsAPI:
         Returns:
             Credentials instance that auto-refreshes using the stored refresh token.
         """
-        client_id = self._get_secret(project_id, SECRET_CLIENT_ID)
-        client_secret = self._get_secret(project_id, SECRET_CLIENT_SECRET)
-        refresh_token = self._get_secret(project_id, SECRET_REFRESH_TOKEN)
+        if project_id in _CREDENTIALS:
+            return _CREDENTIALS[project_id]
+
+        # The three reads are independent RPCs, so issue them concurrently
+        # over the shared Secret Manager channel
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            client_id, client_secret, refresh_token = executor.map(
+                lambda secret_id: self._get_secret(project_id, secret_id),
+                [SECRET_CLIENT_ID, SECRET_CLIENT_SECRET, SECRET_REFRESH_TOKEN],
+            )
 
-        return Credentials(
+        credentials = Credentials(
             token=None,
             refresh_token=refresh_token,
             client_id=client_id,
@@ -54,6 +115,8 @@ class YouTubeAnalyticsAPI:
             token_uri=TOKEN_URI,
             scopes=SCOPES,
         )
+        _CREDENTIALS[project_id] = credentials
+        return credentials
 
     @staticmethod
     def _get_secret(project_id: str, secret_id: str) -> str:
@@ -66,81 +129,134 @@ class YouTubeAnalyticsAPI:
         Returns:
             Secret value as string.
         """
-        client = secretmanager.SecretManagerServiceClient()
+        global _SM_CLIENT
+        # Secrets are read from worker threads — create the shared client once
+        with _SM_CLIENT_LOCK:
+            if _SM_CLIENT is None:
+                _SM_CLIENT = secretmanager.SecretManagerServiceClient()
         name = f"projects/{project_id}/secrets/{secret_id}/versions/latest"
-        response = client.access_secret_version(request={"name": name})
+        response = _SM_CLIENT.access_secret_version(request={"name": name})
         return response.payload.data.decode("utf-8")
 
     def get_video_analytics(
         self, video_ids: list[str], analytics_date: date
-    ) -> tuple[list[dict[str, Any]], list[str]]:
+    ) -> tuple[pa.Table, list[str]]:
         """Fetch per-video analytics for a given date.
 
-        Makes a single API call with dimensions=video to get all videos at once.
+        Queries dimensions=video in pages of ANALYTICS_PAGE_SIZE (startIndex
+        pagination). The first wave fetches enough pages for every playlist
+        video concurrently, so most channels still need a single call; further
+        pages are only requested while the last page comes back full.
+        Rows are parsed column-wise into an Arrow table (no per-row dicts),
+        which BigQueryWriter.write_daily_video_analytics accepts directly.
 
         Args:
             video_ids: List of video IDs (used to filter results).
             analytics_date: The date to query (typically today - 3 days).
 
         Returns:
-            Tuple of (analytics_rows, error_messages).
+            Tuple of (analytics_table, error_messages).
         """
         errors: list[str] = []
         date_str = str(analytics_date)
 
+        # At most one row per video with activity, so this many pages covers
+        # the playlist; extra rows (e.g. deleted videos) spill into later pages
+        wave_size = max(1, -(-len(video_ids) // ANALYTICS_PAGE_SIZE))
+        pages: list[list[list[Any]]] = []
+        start_index = 1
+
         try:
-            response = self._api_call_with_retry(
-                lambda: self.analytics.reports()
-                .query(
-                    ids="channel==MINE",
-                    startDate=date_str,
-                    endDate=date_str,
-                    dimensions="video",
-                    metrics="estimatedMinutesWatched,averageViewDuration,averageViewPercentage,subscribersGained,subscribersLost,shares",
-                    sort="-estimatedMinutesWatched",
-                    maxResults=200,
-                )
-                .execute()
-            )
+            with ThreadPoolExecutor(max_workers=wave_size) as executor:
+                while True:
+                    wave = list(
+                        executor.map(
+                            lambda index: self._fetch_video_analytics_page(date_str, index),
+                            range(
+                                start_index,
+                                start_index + wave_size * ANALYTICS_PAGE_SIZE,
+                                ANALYTICS_PAGE_SIZE,
+                            ),
+                        )
+                    )
+                    pages.extend(wave)
+                    if len(wave[-1]) < ANALYTICS_PAGE_SIZE:
+                        break
+                    start_index += wave_size * ANALYTICS_PAGE_SIZE
+                    wave_size = 1
         except Exception as e:
             logger.error(f"Analytics API query failed: {e}")
-            return [], [f"Analytics query failed: {str(e)}"]
-
-        # Parse response rows
-        video_id_set = set(video_ids)
-        rows: list[dict[str, Any]] = []
-
-        for row in response.get("rows", []):
-            vid = row[0]
-            if vid not in video_id_set:
-                continue
-
-            rows.append(
-                {
-                    "video_id": vid,
-                    "estimated_minutes_watched": row[1],
-                    "average_view_duration_seconds": row[2],
-                    "average_view_percentage": row[3],
-                    "subscribers_gained": row[4],
-                    "subscribers_lost": row[5],
-                    "shares": row[6],
-                    # Impressions/CTR populated from traffic source data
-                    "impressions": None,
-                    "impression_ctr": None,
-                    "annotation_click_through_rate": None,
-                    "card_click_rate": None,
-                }
+            return self._video_analytics_table([]), [f"Analytics query failed: {str(e)}"]
+
+        # Dedupe by video_id in case rankings shifted between pages
+        rows = list({row[0]: row for page in pages for row in page}.values())
+
+        # Parse response rows, keeping only videos from the uploads playlist
+        table = self._video_analytics_table(rows)
+        table = table.filter(pc.is_in(table["video_id"], value_set=pa.array(video_ids, pa.string())))
+
+        logger.info(f"Got analytics for {table.num_rows} videos (date: {date_str})")
+        return table, errors
+
+    def _fetch_video_analytics_page(self, date_str: str, start_index: int) -> list[list[Any]]:
+        """Fetch one page of the per-video analytics report.
+
+        Runs on a worker thread using that thread's own Analytics resource.
+
+        Args:
+            date_str: The date to query (YYYY-MM-DD).
+            start_index: 1-based index of the first row of the page.
+
+        Returns:
+            Response rows ordered as VIDEO_ANALYTICS_COLUMNS.
+        """
+        analytics = self._thread_analytics.get()
+        response = self._api_call_with_retry(
+            lambda: analytics.reports()
+            .query(
+                ids="channel==MINE",
+                startDate=date_str,
+                endDate=date_str,
+                dimensions="video",
+                metrics="estimatedMinutesWatched,averageViewDuration,averageViewPercentage,subscribersGained,subscribersLost,shares",
+                sort="-estimatedMinutesWatched",
+                maxResults=ANALYTICS_PAGE_SIZE,
+                startIndex=start_index,
             )
+            .execute()
+        )
+        return response.get("rows", [])
+
+    @staticmethod
+    def _video_analytics_table(rows: list[list[Any]]) -> pa.Table:
+        """Transpose Analytics API response rows into daily_video_analytics columns.
 
-        logger.info(f"Got analytics for {len(rows)} videos (date: {date_str})")
-        return rows, errors
+        Args:
+            rows: Response rows ordered as VIDEO_ANALYTICS_COLUMNS.
+
+        Returns:
+            Arrow table with every daily_video_analytics column except snapshot_date.
+        """
+        columns = list(zip(*rows)) or [()] * len(VIDEO_ANALYTICS_COLUMNS)
+        arrays = {
+            name: pa.array(values, dtype)
+            for (name, dtype), values in zip(VIDEO_ANALYTICS_COLUMNS, columns)
+        }
+        for name, dtype in VIDEO_ANALYTICS_NULL_COLUMNS:
+            arrays[name] = pa.nulls(len(rows), dtype)
+        return pa.table(arrays)
 
     def get_traffic_sources(
         self, video_ids: list[str], analytics_date: date
     ) -> tuple[list[dict[str, Any]], list[str]]:
         """Fetch traffic source breakdown per video.
 
-        Per-video calls required since the traffic source dimension needs a video filter.
+        Attempts batches of TRAFFIC_BATCH_SIZE videos using a multi-value video
+        filter with dimensions=video,insightTrafficSourceType, and falls back to
+        per-video calls on a bounded thread pool (TRAFFIC_CONCURRENCY) for any
+        batch that fails. The traffic source report may not accept video as a
+        dimension; once a batch is rejected (400), the remaining videos go
+        straight to per-video calls.
 
         Args:
             video_ids: List of video IDs.
@@ -152,46 +268,86 @@ class YouTubeAnalyticsAPI:
         errors: list[str] = []
         all_rows: list[dict[str, Any]] = []
         date_str = str(analytics_date)
+        fallback_ids: list[str] = []
 
-        for video_id in video_ids:
+        for i in range(0, len(video_ids), TRAFFIC_BATCH_SIZE):
+            batch = video_ids[i : i + TRAFFIC_BATCH_SIZE]
             try:
-                response = self._api_call_with_retry(
-                    lambda vid=video_id: self.analytics.reports()
-                    .query(
-                        ids="channel==MINE",
-                        startDate=date_str,
-                        endDate=date_str,
-                        dimensions="insightTrafficSourceType",
-                        metrics="views,estimatedMinutesWatched",
-                        filters=f"video=={vid}",
-                    )
-                    .execute()
-                )
-
-                for row in response.get("rows", []):
-                    all_rows.append(
-                        {
-                            "video_id": video_id,
-                            "traffic_source_type": row[0],
-                            "views": row[1],
-                            "estimated_minutes_watched": row[2],
-                        }
-                    )
-
+                all_rows.extend(self._fetch_traffic_batch(batch, date_str))
             except Exception as e:
-                logger.warning(f"Traffic sources failed for {video_id}: {e}")
-                errors.append(f"{video_id}: {str(e)}")
+                logger.warning(
+                    f"Batched traffic query failed for {len(batch)} videos, "
+                    f"falling back to per-video calls: {e}"
+                )
+                if isinstance(e, HttpError) and e.resp.status == 400:
+                    # Query shape rejected — later batches would fail the same way
+                    fallback_ids.extend(video_ids[i:])
+                    break
+                fallback_ids.extend(batch)
+
+        if fallback_ids:
+            with ThreadPoolExecutor(max_workers=TRAFFIC_CONCURRENCY) as executor:
+                results = executor.map(
+                    lambda vid: self._fetch_one_traffic(vid, date_str), fallback_ids
+                )
+                # map() yields in input order, so rows and errors are
+                # aggregated on this thread without a lock
+                for rows, err in results:
+                    all_rows.extend(rows)
+                    if err:
+                        errors.append(err)
 
         logger.info(
             f"Got traffic sources: {len(all_rows)} rows for {len(video_ids)} videos"
         )
         return all_rows, errors
 
+    def _fetch_traffic_batch(
+        self, video_ids: list[str], date_str: str
+    ) -> list[dict[str, Any]]:
+        """Fetch the traffic source breakdown for a batch of videos in one call.
+
+        Args:
+            video_ids: Up to TRAFFIC_BATCH_SIZE video IDs.
+            date_str: The date to query (YYYY-MM-DD).
+
+        Returns:
+            List of traffic rows for every video in the batch.
+
+        Raises:
+            HttpError: If the API rejects the query or fails after all retries.
+        """
+        return query_traffic_batch(self.analytics, video_ids, date_str)
+
+    def _fetch_one_traffic(
+        self, video_id: str, date_str: str
+    ) -> tuple[list[dict[str, Any]], str | None]:
+        """Fetch the traffic source breakdown for a single video.
+
+        Runs on a worker thread using that thread's own Analytics resource.
+
+        Args:
+            video_id: YouTube video ID.
+            date_str: The date to query (YYYY-MM-DD).
+
+        Returns:
+            Tuple of (traffic_rows, error_message or None).
+        """
+        try:
+            return query_traffic_one(self._thread_analytics.get(), video_id, date_str), None
+        except Exception as e:
+            logger.warning(f"Traffic sources failed for {video_id}: {e}")
+            return [], f"{video_id}: {str(e)}"
+
     @staticmethod
     def _api_call_with_retry(
         callable_fn: Any, max_retries: int = 3
     ) -> dict[str, Any]:
-        """Execute an API call with exponential backoff on rate limits.
+        """Execute an API call with jittered exponential backoff on retryable errors.
+
+        Honors the server's Retry-After header when present; otherwise waits a
+        random time up to RETRY_BASE_SECONDS * 2**attempt (capped), so
+        concurrent workers don't retry in lockstep.
 
         Args:
             callable_fn: Zero-argument callable that executes the API call.
@@ -207,12 +363,119 @@ class YouTubeAnalyticsAPI:
             try:
                 return callable_fn()
             except HttpError as e:
-                if e.resp.status == 429 and attempt < max_retries:
-                    wait = 2**attempt
+                if e.resp.status in RETRYABLE_STATUSES and attempt < max_retries:
+                    wait = YouTubeAnalyticsAPI._retry_wait(e, attempt)
                     logger.warning(
-                        f"Rate limited, retrying in {wait}s (attempt {attempt + 1}/{max_retries})"
+                        f"API error {e.resp.status}, retrying in {wait:.1f}s "
+                        f"(attempt {attempt + 1}/{max_retries})"
                     )
                     time.sleep(wait)
                 else:
                     raise
         raise RuntimeError("Unreachable")
+
+    @staticmethod
+    def _retry_wait(error: HttpError, attempt: int) -> float:
+        """Seconds to wait before retrying a failed call.
+
+        Args:
+            error: The HttpError from the failed attempt.
+            attempt: Zero-based attempt number.
+
+        Returns:
+            Retry-After seconds if the server sent them, else a full-jitter backoff.
+        """
+        retry_after = error.resp.get("retry-after")
+        if retry_after:
+            try:
+                return min(float(retry_after), RETRY_MAX_SECONDS)
+            except ValueError:
+                pass  # HTTP-date form — fall back to backoff
+        return random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2**attempt))
+
+
+def query_traffic_batch(
+    analytics: Any,
+    video_ids: list[str],
+    date_str: str,
+    retry: Callable[[Callable[[], Any]], dict[str, Any]] | None = None,
+) -> list[dict[str, Any]]:
+    """Query the traffic source breakdown for several videos in one call.
+
+    Shared by the pipeline and setup/backfill_analytics.py.
+
+    Args:
+        analytics: Analytics API resource.
+        video_ids: Up to TRAFFIC_BATCH_SIZE video IDs.
+        date_str: The date to query (YYYY-MM-DD).
+        retry: Callable that executes a zero-argument API call with retries.
+            Defaults to the pipeline's retry policy.
+
+    Returns:
+        List of traffic rows for every video in the batch.
+
+    Raises:
+        HttpError: If the API rejects the query or fails after all retries.
+    """
+    request = analytics.reports().query(
+        ids="channel==MINE",
+        startDate=date_str,
+        endDate=date_str,
+        dimensions="video,insightTrafficSourceType",
+        metrics="views,estimatedMinutesWatched",
+        filters=f"video=={','.join(video_ids)}",
+        maxResults=10000,
+    )
+    response = (retry or YouTubeAnalyticsAPI._api_call_with_retry)(request.execute)
+    return [
+        {
+            "video_id": row[0],
+            "traffic_source_type": row[1],
+            "views": row[2],
+            "estimated_minutes_watched": row[3],
+        }
+        for row in response.get("rows", [])
+    ]
+
+
+def query_traffic_one(
+    analytics: Any,
+    video_id: str,
+    date_str: str,
+    retry: Callable[[Callable[[], Any]], dict[str, Any]] | None = None,
+) -> list[dict[str, Any]]:
+    """Query the traffic source breakdown for a single video.
+
+    Shared by the pipeline and setup/backfill_analytics.py.
+
+    Args:
+        analytics: Analytics API resource.
+        video_id: YouTube video ID.
+        date_str: The date to query (YYYY-MM-DD).
+        retry: Callable that executes a zero-argument API call with retries.
+            Defaults to the pipeline's retry policy.
+
+    Returns:
+        List of traffic rows for the video.
+
+    Raises:
+        HttpError: If the query fails after all retries.
+    """
+    request = analytics.reports().query(
+        ids="channel==MINE",
+        startDate=date_str,
+        endDate=date_str,
+        dimensions="insightTrafficSourceType",
+        metrics="views,estimatedMinutesWatched",
+        filters=f"video=={video_id}",
+    )
+    response = (retry or YouTubeAnalyticsAPI._api_call_with_retry)(request.execute)
+    return [
+        {
+            "video_id": video_id,
+            "traffic_source_type": row[0],
+            "views": row[1],
+            "estimated_minutes_watched": row[2],
+        }
+        for row in response.get("rows", [])
+    ]
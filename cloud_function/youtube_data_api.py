@@ -1,15 +1,23 @@
 """YouTube Data API v3 client for fetching video metadata and public stats."""
 
 import logging
-import re
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
-from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+from api_clients import PerThreadResource, build_resource
 
 logger = logging.getLogger(__name__)
 
 SHORTS_THRESHOLD_SECONDS = 180
 
+# videos.list parts needed for the video_metadata and daily_video_stats rows
+VIDEO_PARTS = ("snippet", "contentDetails", "statistics")
+
+# videos.list batches in flight while the uploads playlist is still paging
+DETAILS_CONCURRENCY = 8
+
 
 class YouTubeDataAPI:
     """Client for YouTube Data API v3."""
@@ -21,14 +29,68 @@ class YouTubeDataAPI:
             api_key: YouTube Data API v3 key.
             uploads_playlist_id: The uploads playlist ID (UC -> UU prefix).
         """
-        self.youtube = build("youtube", "v3", developerKey=api_key)
+        self.api_key = api_key
+        self.youtube = self._build_youtube()
         self.uploads_playlist_id = uploads_playlist_id
+        self._thread_youtube = PerThreadResource(self._build_youtube)
+
+    def _build_youtube(self) -> Any:
+        """Build a Data API resource with its own persistent connection."""
+        return build_resource("youtube", "v3", developer_key=self.api_key)
+
+    def get_all_videos(
+        self, etag_cache: dict[str, dict[str, Any]] | None = None
+    ) -> tuple[list[str], list[dict[str, Any]]]:
+        """Fetch all video IDs from the uploads playlist along with their details.
+
+        Each page of playlistItems (50 IDs, max per page) is handed to a
+        videos.list call on a thread pool as soon as it arrives, so detail
+        fetches overlap with paging through the rest of the playlist.
+
+        Args:
+            etag_cache: Optional playlist page cache (see _list_playlist_page),
+                updated in place.
+
+        Returns:
+            Tuple of (video_ids, video_details). Details are in playlist
+            order, with keys matching the video_metadata and
+            daily_video_stats schemas.
+        """
+        video_ids: list[str] = []
+        next_page_token: str | None = None
+
+        with ThreadPoolExecutor(max_workers=DETAILS_CONCURRENCY) as executor:
+            futures = []
+            while True:
+                page_ids, next_page_token = self._list_playlist_page(next_page_token, etag_cache)
+                if page_ids:
+                    video_ids.extend(page_ids)
+                    futures.append(executor.submit(self._fetch_batch_details, page_ids))
 
-    def get_all_video_ids(self) -> list[str]:
+                if not next_page_token:
+                    break
+
+            all_details: list[dict[str, Any]] = []
+            for future in futures:
+                all_details.extend(future.result())
+
+        logger.info(
+            f"Found {len(video_ids)} videos in uploads playlist, "
+            f"fetched details for {len(all_details)} in {len(futures)} batches"
+        )
+        return video_ids, all_details
+
+    def get_all_video_ids(
+        self, etag_cache: dict[str, dict[str, Any]] | None = None
+    ) -> list[str]:
         """Fetch all video IDs from the uploads playlist.
 
         Handles pagination (max 50 per page).
 
+        Args:
+            etag_cache: Optional playlist page cache (see _list_playlist_page),
+                updated in place.
+
         Returns:
             List of video ID strings.
         """
@@ -36,33 +98,80 @@ class YouTubeDataAPI:
         next_page_token: str | None = None
 
         while True:
-            request = self.youtube.playlistItems().list(
-                part="contentDetails",
-                playlistId=self.uploads_playlist_id,
-                maxResults=50,
-                pageToken=next_page_token,
-            )
-            response = request.execute()
-
-            for item in response.get("items", []):
-                video_id = item["contentDetails"]["videoId"]
-                video_ids.append(video_id)
+            page_ids, next_page_token = self._list_playlist_page(next_page_token, etag_cache)
+            video_ids.extend(page_ids)
 
-            next_page_token = response.get("nextPageToken")
             if not next_page_token:
                 break
 
         logger.info(f"Found {len(video_ids)} videos in uploads playlist")
         return video_ids
 
-    def get_video_details(self, video_ids: list[str]) -> list[dict[str, Any]]:
+    def _list_playlist_page(
+        self,
+        page_token: str | None,
+        etag_cache: dict[str, dict[str, Any]] | None = None,
+    ) -> tuple[list[str], str | None]:
+        """Fetch one page (50 items) of the uploads playlist, revalidating by ETag.
+
+        With an etag_cache, a page seen on an earlier run is requested with
+        If-None-Match; on 304 Not Modified its cached video IDs are reused
+        without parsing a response. The cache maps each page token ("" for
+        the first page) to {"etag", "video_ids", "next_page_token"} and is
+        JSON-serializable so callers can persist it between runs.
+
+        Args:
+            page_token: nextPageToken from the previous page, or None for the first.
+            etag_cache: Optional page cache, updated in place with fresh pages.
+
+        Returns:
+            Tuple of (video_ids on the page, next page token or None).
+
+        Raises:
+            HttpError: If the request fails (other than a 304 for a cached page).
+        """
+        key = page_token or ""
+        cached = etag_cache.get(key) if etag_cache is not None else None
+
+        request = self.youtube.playlistItems().list(
+            part="contentDetails",
+            playlistId=self.uploads_playlist_id,
+            maxResults=50,
+            pageToken=page_token,
+        )
+        if cached is not None:
+            request.headers["If-None-Match"] = cached["etag"]
+
+        try:
+            response = request.execute()
+        except HttpError as e:
+            if cached is not None and e.resp.status == 304:
+                return cached["video_ids"], cached["next_page_token"]
+            raise
+
+        page_ids = [item["contentDetails"]["videoId"] for item in response.get("items", [])]
+        next_page_token = response.get("nextPageToken")
+        if etag_cache is not None and "etag" in response:
+            etag_cache[key] = {
+                "etag": response["etag"],
+                "video_ids": page_ids,
+                "next_page_token": next_page_token,
+            }
+        return page_ids, next_page_token
+
+    def get_video_details(
+        self, video_ids: list[str], parts: tuple[str, ...] = VIDEO_PARTS
+    ) -> list[dict[str, Any]]:
         """Fetch full details for a list of video IDs.
 
         Batches into groups of 50 (API max per request).
-        Fetches parts: snippet, contentDetails, statistics.
+        Fetches parts: snippet, contentDetails, statistics by default.
 
         Args:
             video_ids: List of YouTube video IDs.
+            parts: videos.list parts to request. Callers that only need
+                duration / video type can pass ("contentDetails",); fields
+                from parts not requested come back as their defaults.
 
         Returns:
             List of processed video detail dicts with keys matching
@@ -72,25 +181,43 @@ class YouTubeDataAPI:
 
         for i in range(0, len(video_ids), 50):
             batch = video_ids[i : i + 50]
-            request = self.youtube.videos().list(
-                part="snippet,contentDetails,statistics",
-                id=",".join(batch),
-            )
-            response = request.execute()
-
-            for item in response.get("items", []):
-                details = self._parse_video_item(item)
-                all_details.append(details)
+            all_details.extend(self._fetch_batch_details(batch, parts))
 
             logger.info(f"Fetched details for batch {i // 50 + 1} ({len(batch)} videos)")
 
         return all_details
 
-    def _parse_video_item(self, item: dict[str, Any]) -> dict[str, Any]:
+    def _fetch_batch_details(
+        self, video_ids: list[str], parts: tuple[str, ...] = VIDEO_PARTS
+    ) -> list[dict[str, Any]]:
+        """Fetch and parse details for up to 50 video IDs in one videos.list call.
+
+        Safe to call from worker threads (uses a per-thread resource).
+
+        Args:
+            video_ids: Up to 50 YouTube video IDs.
+            parts: videos.list parts to request.
+
+        Returns:
+            List of processed video detail dicts.
+        """
+        request = self._thread_youtube.get().videos().list(
+            part=",".join(parts),
+            id=",".join(video_ids),
+        )
+        response = request.execute()
+
+        return [self._parse_video_item(item) for item in response.get("items", [])]
+
+    def _parse_video_item(
+        self, item: dict[str, Any], _shorts_threshold: int = SHORTS_THRESHOLD_SECONDS
+    ) -> dict[str, Any]:
         """Parse a single video API response item into a flat dict.
 
         Args:
             item: A single item from the videos.list API response.
+            _shorts_threshold: SHORTS_THRESHOLD_SECONDS bound as a local for
+                the per-video hot path; not meant to be passed.
 
         Returns:
             Dict with keys for both video_metadata and daily_video_stats tables.
@@ -103,12 +230,12 @@ class YouTubeDataAPI:
             content_details.get("duration", "PT0S")
         )
 
-        tags = snippet.get("tags", [])
-        thumbnails = snippet.get("thumbnails", {})
-        thumbnail_url = (
-            thumbnails.get("maxresdefault", {}).get("url")
-            or thumbnails.get("high", {}).get("url")
-            or thumbnails.get("default", {}).get("url", "")
+        thumbnails = snippet.get("thumbnails") or {}
+        thumbnail = (
+            thumbnails.get("maxresdefault")
+            or thumbnails.get("high")
+            or thumbnails.get("default")
+            or {}
         )
 
         return {
@@ -117,10 +244,11 @@ class YouTubeDataAPI:
             "published_at": snippet.get("publishedAt", ""),
             "duration_seconds": duration_seconds,
             "duration_formatted": duration_formatted,
-            "video_type": self.classify_video_type(duration_seconds),
-            "tags": ",".join(tags) if tags else "",
+            # Inlined classify_video_type (saves a call per video)
+            "video_type": "short" if duration_seconds <= _shorts_threshold else "full_length",
+            "tags": ",".join(snippet.get("tags") or ()),
             "category_id": snippet.get("categoryId", ""),
-            "thumbnail_url": thumbnail_url,
+            "thumbnail_url": thumbnail.get("url", ""),
             # Stats (for daily_video_stats table)
             "view_count": int(statistics.get("viewCount", 0)),
             "like_count": int(statistics.get("likeCount", 0)),
@@ -139,13 +267,24 @@ class YouTubeDataAPI:
             Tuple of (total_seconds, formatted_string).
             E.g., (754, '12:34') or (4374, '1:12:54').
         """
-        match = re.match(r"PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?", iso_duration)
-        if not match:
+        # YouTube only emits the PT[nH][nM][nS] subset, so a single scan over
+        # the string is enough (no regex match or group objects per video)
+        if not iso_duration.startswith("PT"):
             return (0, "0:00")
 
-        hours = int(match.group(1) or 0)
-        minutes = int(match.group(2) or 0)
-        seconds = int(match.group(3) or 0)
+        hours = minutes = seconds = 0
+        n = 0
+        for c in iso_duration[2:]:
+            if "0" <= c <= "9":
+                n = n * 10 + ord(c) - 48
+            elif c == "H":
+                hours, n = n, 0
+            elif c == "M":
+                minutes, n = n, 0
+            elif c == "S":
+                seconds, n = n, 0
+            else:
+                break
         total_seconds = hours * 3600 + minutes * 60 + seconds
 
         if hours > 0:
@@ -156,13 +295,17 @@ class YouTubeDataAPI:
         return (total_seconds, formatted)
 
     @staticmethod
-    def classify_video_type(duration_seconds: int) -> str:
+    def classify_video_type(
+        duration_seconds: int, _t: int = SHORTS_THRESHOLD_SECONDS
+    ) -> str:
         """Classify video as 'short' or 'full_length'.
 
         Args:
             duration_seconds: Video duration in seconds.
+            _t: SHORTS_THRESHOLD_SECONDS bound as a local (fast lookup);
+                not meant to be passed.
 
         Returns:
             'short' if <= 180 seconds, else 'full_length'.
         """
-        return "short" if duration_seconds <= SHORTS_THRESHOLD_SECONDS else "full_length"
+        return "short" if duration_seconds <= _t else "full_length"
@@ -19,7 +19,7 @@ echo ""
 gcloud functions deploy "$FUNCTION_NAME" \
     --gen2 \
     --region="$REGION" \
-    --runtime=python311 \
+    --runtime=python312 \
     --source="$REPO_ROOT/cloud_function/" \
     --entry-point=main \
     --trigger-http \
@@ -1,26 +1,42 @@
 """Backfill historical analytics data from the YouTube Analytics API.
 
 Queries the Analytics API for each day in the date range and writes
-to daily_video_analytics and daily_traffic_sources in BigQuery.
+to daily_video_analytics and daily_traffic_sources in BigQuery. Each day's
+partition is replaced through a Storage Write API pending stream using the
+cloud function's BigQueryWriter.
 
 Usage:
+    pip install -r cloud_function/requirements.txt
     python3 setup/backfill_analytics.py --start 2025-10-16 --end 2026-02-17
 """
 
 import argparse
-import io
-import json
+import functools
 import logging
+import random
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import date, datetime, timedelta
+from pathlib import Path
 from typing import Any
 
 from google.cloud import bigquery, secretmanager
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+# Reuse the pipeline's API client helpers, writer (Storage Write API
+# pending streams) and traffic source queries
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "cloud_function"))
+from api_clients import PerThreadResource, build_resource  # noqa: E402
+from bigquery_writer import BigQueryWriter  # noqa: E402
+from youtube_analytics_api import (  # noqa: E402
+    TRAFFIC_BATCH_SIZE,
+    query_traffic_batch,
+    query_traffic_one,
+)
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
 logger = logging.getLogger(__name__)
 
@@ -28,135 +44,195 @@ PROJECT_ID = "primeval-node-478707-e9"
 DATASET_ID = "youtube_analytics"
 TOKEN_URI = "https://oauth2.googleapis.com/token"
 
+# Days processed concurrently; the work is all HTTP round-trips, and 429s
+# are absorbed by api_call_with_retry
+BACKFILL_WORKERS = 8
+
+# Retry backoff: longest single wait, and the extra random fraction added
+RETRY_MAX_SECONDS = 60
+RETRY_JITTER = 0.1
+
+# Metrics for daily_video_analytics, in video_analytics_row order
+VIDEO_ANALYTICS_METRICS = "estimatedMinutesWatched,averageViewDuration,averageViewPercentage,subscribersGained,subscribersLost,shares"
+
+# Rows per video analytics page (API max when grouping by video)
+ANALYTICS_PAGE_SIZE = 200
+
+# Set once the API rejects the batched traffic query, so later days skip it
+_traffic_batch_rejected = threading.Event()
+
 
+@functools.lru_cache(maxsize=1)
+def secret_client() -> secretmanager.SecretManagerServiceClient:
+    """Return the shared Secret Manager client (one gRPC channel per run)."""
+    return secretmanager.SecretManagerServiceClient()
+
+
+@functools.lru_cache(maxsize=None)
 def get_secret(secret_id: str) -> str:
-    """Read a secret from Secret Manager."""
-    client = secretmanager.SecretManagerServiceClient()
+    """Read a secret from Secret Manager (cached; secrets don't change mid-run)."""
+    client = secret_client()
     name = f"projects/{PROJECT_ID}/secrets/{secret_id}/versions/latest"
     response = client.access_secret_version(request={"name": name})
     return response.payload.data.decode("utf-8")
 
 
-def build_analytics_client():
-    """Build YouTube Analytics API client using OAuth credentials from Secret Manager."""
-    credentials = Credentials(
+def load_credentials() -> Credentials:
+    """Build OAuth credentials from Secret Manager."""
+    return Credentials(
         token=None,
         refresh_token=get_secret("youtube-oauth-refresh-token"),
         client_id=get_secret("youtube-oauth-client-id"),
         client_secret=get_secret("youtube-oauth-client-secret"),
         token_uri=TOKEN_URI,
     )
-    return build("youtubeAnalytics", "v2", credentials=credentials)
 
 
-def api_call_with_retry(fn, max_retries: int = 5):
-    """Execute API call with exponential backoff."""
+def build_analytics_client(credentials: Credentials):
+    """Build a YouTube Analytics API client on its own long-lived connection."""
+    return build_resource("youtubeAnalytics", "v2", credentials=credentials)
+
+
+def api_call_with_retry(fn, *args, max_retries: int = 5, **kwargs):
+    """Call fn(*args, **kwargs) with jittered exponential backoff, honoring Retry-After.
+
+    Pass a bound method such as request.execute rather than wrapping the call
+    in a lambda; an HttpRequest can be executed again on retry.
+    """
     for attempt in range(max_retries + 1):
         try:
-            return fn()
+            return fn(*args, **kwargs)
         except HttpError as e:
             if e.resp.status in (429, 503) and attempt < max_retries:
-                wait = 2 ** attempt
-                logger.warning(f"Rate limited ({e.resp.status}), retrying in {wait}s")
+                wait = retry_wait(e, attempt)
+                logger.warning(f"Rate limited ({e.resp.status}), retrying in {wait:.1f}s")
                 time.sleep(wait)
             else:
                 raise
 
 
-def fetch_video_analytics(analytics, query_date: date) -> list[dict[str, Any]]:
-    """Fetch per-video analytics for a single day."""
-    date_str = str(query_date)
-    try:
-        response = api_call_with_retry(
-            lambda: analytics.reports().query(
-                ids="channel==MINE",
-                startDate=date_str,
-                endDate=date_str,
-                dimensions="video",
-                metrics="estimatedMinutesWatched,averageViewDuration,averageViewPercentage,subscribersGained,subscribersLost,shares",
-                sort="-estimatedMinutesWatched",
-                maxResults=200,
-            ).execute()
-        )
-    except Exception as e:
-        logger.error(f"  Analytics query failed for {date_str}: {e}")
-        return []
-
-    rows = []
-    for row in response.get("rows", []):
-        rows.append({
-            "video_id": row[0],
-            "estimated_minutes_watched": row[1],
-            "average_view_duration_seconds": row[2],
-            "average_view_percentage": row[3],
-            "subscribers_gained": row[4],
-            "subscribers_lost": row[5],
-            "shares": row[6],
-            "impressions": None,
-            "impression_ctr": None,
-            "annotation_click_through_rate": None,
-            "card_click_rate": None,
-        })
-    return rows
-
-
-def fetch_traffic_sources(analytics, video_ids: list[str], query_date: date) -> list[dict[str, Any]]:
-    """Fetch traffic source data for all videos for a single day."""
-    date_str = str(query_date)
-    all_rows = []
+def retry_wait(error: HttpError, attempt: int) -> float:
+    """Seconds to wait before a retry: Retry-After if sent, else 2^attempt, plus jitter.
 
-    for video_id in video_ids:
+    The jitter keeps the backfill's worker threads from retrying in lockstep.
+    """
+    wait = min(2 ** attempt, RETRY_MAX_SECONDS)
+    retry_after = error.resp.get("retry-after")
+    if retry_after:
         try:
-            response = api_call_with_retry(
-                lambda vid=video_id: analytics.reports().query(
-                    ids="channel==MINE",
-                    startDate=date_str,
-                    endDate=date_str,
-                    dimensions="insightTrafficSourceType",
-                    metrics="views,estimatedMinutesWatched",
-                    filters=f"video=={vid}",
-                ).execute()
-            )
-            for row in response.get("rows", []):
-                all_rows.append({
-                    "video_id": video_id,
-                    "traffic_source_type": row[0],
-                    "views": row[1],
-                    "estimated_minutes_watched": row[2],
-                })
-        except Exception as e:
-            logger.warning(f"  Traffic sources failed for {video_id}: {e}")
-
-    return all_rows
+            wait = min(float(retry_after), RETRY_MAX_SECONDS)
+        except ValueError:
+            pass  # HTTP-date form — fall back to backoff
+    return wait + random.uniform(0, wait * RETRY_JITTER)
+
+
+def video_analytics_row(video_id: str, metrics: list) -> dict[str, Any]:
+    """Map one VIDEO_ANALYTICS_METRICS result row onto the daily_video_analytics columns."""
+    return {
+        "video_id": video_id,
+        "estimated_minutes_watched": metrics[0],
+        "average_view_duration_seconds": metrics[1],
+        "average_view_percentage": metrics[2],
+        "subscribers_gained": metrics[3],
+        "subscribers_lost": metrics[4],
+        "shares": metrics[5],
+        "impressions": None,
+        "impression_ctr": None,
+        "annotation_click_through_rate": None,
+        "card_click_rate": None,
+    }
+
+
+def fetch_video_analytics_range(analytics, start_date: date, end_date: date) -> dict[date, list[dict[str, Any]]]:
+    """Fetch per-video analytics for every day in the range, bucketed by day.
+
+    One dimensions=day,video query covers the whole backfill, paged with
+    startIndex in ANALYTICS_PAGE_SIZE rows. Days with no rows are absent.
+
+    Raises:
+        HttpError: If a page fails after all retries.
+    """
+    # Bucketed by the API's YYYY-MM-DD string; parsed once per day at the end
+    by_day: dict[str, list[dict[str, Any]]] = {}
+    start_index = 1
+    while True:
+        request = analytics.reports().query(
+            ids="channel==MINE",
+            startDate=str(start_date),
+            endDate=str(end_date),
+            dimensions="day,video",
+            metrics=VIDEO_ANALYTICS_METRICS,
+            sort="day,-estimatedMinutesWatched",
+            maxResults=ANALYTICS_PAGE_SIZE,
+            startIndex=start_index,
+        )
+        response = api_call_with_retry(request.execute)
+        rows = response.get("rows", [])
+        for row in rows:
+            by_day.setdefault(row[0], []).append(video_analytics_row(row[1], row[2:]))
+        if len(rows) < ANALYTICS_PAGE_SIZE:
+            return {date.fromisoformat(day): day_rows for day, day_rows in by_day.items()}
+        start_index += ANALYTICS_PAGE_SIZE
 
 
-def write_to_bigquery(bq_client: bigquery.Client, table_name: str, rows: list[dict], snapshot_date: date) -> int:
-    """Delete existing rows for the date, then batch insert new ones."""
-    table_ref = f"{PROJECT_ID}.{DATASET_ID}.{table_name}"
+def fetch_video_analytics(analytics, query_date: date) -> list[dict[str, Any]]:
+    """Fetch per-video analytics for a single day (fallback for the range query).
 
-    # Delete existing
-    delete_query = f"DELETE FROM `{table_ref}` WHERE snapshot_date = @snapshot_date"
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[bigquery.ScalarQueryParameter("snapshot_date", "DATE", str(snapshot_date))]
+    Raises:
+        HttpError: If the query fails after all retries, so the caller can
+            leave the day's partition alone instead of clearing it.
+    """
+    date_str = str(query_date)
+    request = analytics.reports().query(
+        ids="channel==MINE",
+        startDate=date_str,
+        endDate=date_str,
+        dimensions="video",
+        metrics=VIDEO_ANALYTICS_METRICS,
+        sort="-estimatedMinutesWatched",
+        maxResults=ANALYTICS_PAGE_SIZE,
     )
-    bq_client.query(delete_query, job_config=job_config).result()
+    response = api_call_with_retry(request.execute)
+    return [video_analytics_row(row[0], row[1:]) for row in response.get("rows", [])]
 
-    if not rows:
-        return 0
 
-    for row in rows:
-        row["snapshot_date"] = str(snapshot_date)
+def fetch_traffic_sources(
+    analytics, video_ids: list[str], query_date: date
+) -> tuple[list[dict[str, Any]], list[str]]:
+    """Fetch traffic source data for all videos for a single day.
 
-    json_data = "\n".join(json.dumps(r) for r in rows)
-    load_config = bigquery.LoadJobConfig(
-        source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
-        write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
-    )
-    load_job = bq_client.load_table_from_file(
-        io.BytesIO(json_data.encode()), table_ref, job_config=load_config
-    )
-    load_job.result()
-    return len(rows)
+    Attempts a batched query per TRAFFIC_BATCH_SIZE videos and falls back to
+    per-video queries for any batch that fails. Once the API rejects the
+    batched query shape (400), every later batch on every day goes straight
+    to per-video queries.
+
+    Returns:
+        Tuple of (traffic_rows, error_messages). Errors mean some videos'
+        rows are missing for the day.
+    """
+    date_str = str(query_date)
+    all_rows: list[dict[str, Any]] = []
+    errors: list[str] = []
+
+    for i in range(0, len(video_ids), TRAFFIC_BATCH_SIZE):
+        batch = video_ids[i : i + TRAFFIC_BATCH_SIZE]
+        if not _traffic_batch_rejected.is_set():
+            try:
+                all_rows.extend(query_traffic_batch(analytics, batch, date_str, retry=api_call_with_retry))
+                continue
+            except Exception as e:
+                logger.warning(f"  Batched traffic sources failed for {date_str} ({len(batch)} videos), retrying per video: {e}")
+                if isinstance(e, HttpError) and e.resp.status == 400:
+                    _traffic_batch_rejected.set()
+
+        for video_id in batch:
+            try:
+                all_rows.extend(query_traffic_one(analytics, video_id, date_str, retry=api_call_with_retry))
+            except Exception as e:
+                logger.warning(f"  Traffic sources failed for {video_id}: {e}")
+                errors.append(f"{video_id}: {e}")
+
+    return all_rows, errors
 
 
 def main():
@@ -171,39 +247,79 @@ def main():
 
     logger.info(f"Backfilling {total_days} days: {start_date} to {end_date}")
 
-    analytics = build_analytics_client()
-    bq_client = bigquery.Client(project=PROJECT_ID)
-
-    # Get video IDs from the most recent video_metadata snapshot
-    query = f"SELECT DISTINCT video_id FROM `{PROJECT_ID}.{DATASET_ID}.video_metadata` WHERE snapshot_date = (SELECT MAX(snapshot_date) FROM `{PROJECT_ID}.{DATASET_ID}.video_metadata`)"
-    video_ids = [row.video_id for row in bq_client.query(query).result()]
+    credentials = load_credentials()
+    analytics_clients = PerThreadResource(lambda: build_analytics_client(credentials))
+    writer = BigQueryWriter(PROJECT_ID, DATASET_ID)
+
+    # Get video IDs from the most recent video_metadata snapshot. The latest
+    # date is resolved first so the ID query reads a single partition (a
+    # MAX subquery in the filter does not prune partitions)
+    metadata_ref = f"{PROJECT_ID}.{DATASET_ID}.video_metadata"
+    latest_query = f"SELECT MAX(snapshot_date) AS latest FROM `{metadata_ref}`"
+    latest = next(iter(writer.client.query(latest_query).result())).latest
+    query = f"SELECT DISTINCT video_id FROM `{metadata_ref}` WHERE snapshot_date = @d"
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter("d", "DATE", latest)]
+    )
+    video_ids = [row.video_id for row in writer.client.query(query, job_config=job_config).result()]
     logger.info(f"Found {len(video_ids)} videos to backfill")
 
-    total_analytics = 0
-    total_traffic = 0
-
-    current_date = start_date
-    day_num = 0
-    while current_date <= end_date:
-        day_num += 1
-        logger.info(f"[{day_num}/{total_days}] Processing {current_date}...")
-
-        # Fetch and write analytics
-        analytics_rows = fetch_video_analytics(analytics, current_date)
-        a_count = write_to_bigquery(bq_client, "daily_video_analytics", analytics_rows, current_date)
-        total_analytics += a_count
-
-        # Fetch and write traffic sources
-        traffic_rows = fetch_traffic_sources(analytics, video_ids, current_date)
-        t_count = write_to_bigquery(bq_client, "daily_traffic_sources", traffic_rows, current_date)
-        total_traffic += t_count
+    # Video analytics for the whole range in one paged query; fall back to
+    # per-day queries if the API rejects it
+    try:
+        analytics_by_day = fetch_video_analytics_range(analytics_clients.get(), start_date, end_date)
+        logger.info(f"Fetched video analytics for {len(analytics_by_day)} days in one range query")
+    except Exception as e:
+        logger.warning(f"Range analytics query failed, querying day by day: {e}")
+        analytics_by_day = None
 
-        logger.info(f"  → {a_count} analytics rows, {t_count} traffic rows")
+    def process_day(day: date) -> tuple[int, int]:
+        """Write analytics and fetch and write traffic sources for one day."""
+        analytics = analytics_clients.get()
 
-        current_date += timedelta(days=1)
+        # Write analytics (force_delete: empty days still clear the
+        # partition so a re-run leaves no stale rows). A failed fetch leaves
+        # the day's existing partition alone; re-run that day to fill it in
+        a_count = 0
+        try:
+            if analytics_by_day is not None:
+                analytics_rows = analytics_by_day.get(day, [])
+            else:
+                analytics_rows = fetch_video_analytics(analytics, day)
+        except Exception as e:
+            logger.error(
+                f"  {day}: analytics query failed — "
+                f"daily_video_analytics partition left unchanged: {e}"
+            )
+        else:
+            a_count = writer.write_daily_video_analytics(analytics_rows, day, force_delete=True)
+
+        # Fetch and write traffic sources. If any video failed, leave the
+        # day's existing partition alone rather than replacing it with a
+        # partial (or empty) result; re-run that day to fill it in
+        traffic_rows, traffic_errors = fetch_traffic_sources(analytics, video_ids, day)
+        if traffic_errors:
+            logger.warning(
+                f"  {day}: {len(traffic_errors)} traffic source errors — "
+                f"daily_traffic_sources partition left unchanged"
+            )
+            return a_count, 0
+        t_count = writer.write_daily_traffic_sources(traffic_rows, day, force_delete=True)
+        return a_count, t_count
 
-        # Small delay to avoid rate limits
-        time.sleep(0.5)
+    total_analytics = 0
+    total_traffic = 0
+    days = [start_date + timedelta(days=i) for i in range(total_days)]
+
+    # The writer's BigQuery and Storage Write clients are thread-safe and
+    # shared; Analytics clients are per thread
+    with ThreadPoolExecutor(max_workers=BACKFILL_WORKERS) as executor:
+        futures = {executor.submit(process_day, day): day for day in days}
+        for done, future in enumerate(as_completed(futures), start=1):
+            a_count, t_count = future.result()
+            total_analytics += a_count
+            total_traffic += t_count
+            logger.info(f"[{done}/{total_days}] {futures[future]} → {a_count} analytics rows, {t_count} traffic rows")
 
     logger.info(f"Backfill complete: {total_analytics} analytics rows, {total_traffic} traffic rows across {total_days} days")
 